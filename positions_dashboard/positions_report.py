@@ -1,10 +1,13 @@
 import streamlit as st
 import pandas as pd
+import numpy as np
 import psycopg2
+from psycopg2.pool import PoolError, ThreadedConnectionPool
+from contextlib import contextmanager
+from threading import BoundedSemaphore
 from streamlit_autorefresh import st_autorefresh
 from datetime import date, datetime
-import streamlit.components.v1 as components
-import streamlit as st
+from zoneinfo import ZoneInfo
 
 # -------------------------------------------------
 # SIMPLE PASSWORD AUTH
@@ -94,8 +97,80 @@ st.title("📊 Encore – Positions Dashboard")
 # -------------------------------------------------
 # DATABASE CONNECTION
 # -------------------------------------------------
+NUMERIC_AS_FLOAT = psycopg2.extensions.new_type(
+    psycopg2.extensions.DECIMAL.values,
+    "NUMERIC_AS_FLOAT",
+    lambda value, cur: float(value) if value is not None else None,
+)
+
+POOL_MAXCONN = 8
+POOL_WAIT_SECONDS = 30
+
+@st.cache_resource
+def get_pool():
+    # Shared across reruns and sessions; keepalives stop idle
+    # connections being dropped between auto-refreshes. Sessions run
+    # in UTC so snapshot_ts::timestamptz reads a naive column as UTC,
+    # the way the pandas side parses it
+    return ThreadedConnectionPool(
+        1,
+        POOL_MAXCONN,
+        **st.secrets["db"],
+        keepalives=1,
+        keepalives_idle=30,
+        options="-c timezone=UTC",
+    )
+
+@st.cache_resource
+def get_pool_slots():
+    # getconn() raises rather than waits once every connection is out,
+    # so callers queue here for a free one first
+    return BoundedSemaphore(POOL_MAXCONN)
+
+@contextmanager
 def get_conn():
-    return psycopg2.connect(**st.secrets["db"])
+    """
+    Borrow a pooled connection for the block (one transaction),
+    then hand it back; broken connections are discarded.
+    """
+    slots = get_pool_slots()
+    if not slots.acquire(timeout=POOL_WAIT_SECONDS):
+        raise PoolError(
+            f"no database connection free after {POOL_WAIT_SECONDS}s"
+        )
+
+    try:
+        pool = get_pool()
+        conn = pool.getconn()
+        try:
+            # NUMERIC straight to float: no Decimal objects per cell
+            psycopg2.extensions.register_type(NUMERIC_AS_FLOAT, conn)
+            with conn:
+                yield conn
+        finally:
+            pool.putconn(conn, close=bool(conn.closed))
+    finally:
+        slots.release()
+
+def read_frame(sql, params=None, parse_dates=None):
+    """
+    Run a query and build the DataFrame straight from the cursor rows,
+    skipping read_sql's generic DB-API layer.
+    """
+    with get_conn() as conn:
+        with conn.cursor() as cur:
+            cur.execute(sql, params)
+            columns = [d[0] for d in cur.description]
+            df = pd.DataFrame.from_records(
+                cur.fetchall(),
+                columns=columns,
+                coerce_float=True,
+            )
+
+    for col, kwargs in (parse_dates or {}).items():
+        df[col] = pd.to_datetime(df[col], **kwargs)
+
+    return df
 
 TIME_BUCKETS = [
     f"{h:02d}:{m:02d}"
@@ -111,25 +186,39 @@ TIME_GRID = TIME_BUCKETS
 @st.cache_data(ttl=300)
 def load_regime_history():
     sql = """
-        SELECT *
+        SELECT
+            snapshot_date,
+            total_holdings,
+            pct_names_near_high,
+            pct_names_near_low,
+            pct_gross_near_high,
+            pct_gross_near_low
         FROM encoredb.portfolio_52w_regime_snapshot
         ORDER BY snapshot_date
     """
-    with get_conn() as conn:
-        return pd.read_sql(sql, conn)
+    return read_frame(sql)
 
 @st.cache_data(ttl=300)
 def load_regime_detail(snapshot_date):
 
     sql = """
-        SELECT *
+        SELECT
+            ticker,
+            gross_notional,
+            current_price,
+            high_52w,
+            low_52w,
+            pct_from_52w_high,
+            pct_from_52w_low,
+            near_52w_high,
+            near_52w_low
         FROM encoredb.portfolio_52w_regime_detail
         WHERE snapshot_date=%s
+          AND (near_52w_high OR near_52w_low)
         ORDER BY gross_notional DESC
     """
 
-    with get_conn() as conn:
-        return pd.read_sql(sql, conn, params=(snapshot_date,))
+    return read_frame(sql, (snapshot_date,))
 
 @st.cache_data(ttl=300)
 def load_available_dates():
@@ -138,9 +227,7 @@ def load_available_dates():
         FROM encoredb.positions_snapshot
         ORDER BY snapshot_date DESC
     """
-    with get_conn() as conn:
-        df = pd.read_sql(sql, conn)
-    return df["snapshot_date"].tolist()
+    return read_frame(sql)["snapshot_date"].tolist()
 
 available_dates = load_available_dates()
 if not available_dates:
@@ -155,17 +242,8 @@ if st.checkbox("🔄 Auto-refresh every 5 minutes", value=is_today, disabled=not
 
 def safe_select(df, cols):
     """Return only columns that actually exist in df"""
-    return df[[c for c in cols if c in df.columns]]
-
-def safe_sort(df, preferred_cols):
-    """
-    Sort df by the first available column in preferred_cols.
-    If none exist, return df unchanged.
-    """
-    for col in preferred_cols:
-        if col in df.columns:
-            return df.sort_values(col)
-    return df
+    present = set(df.columns)
+    return df[[c for c in cols if c in present]]
 
 def safe_sort(df, preferred_col):
     if df.empty:
@@ -177,29 +255,28 @@ def safe_sort(df, preferred_col):
 # -------------------------------------------------
 # DAILY RETURN BUCKETING (EOD + INTRADAY)
 # -------------------------------------------------
-def compute_daily_returns(df, group_col):
-    df = df.copy()
-
-    # Ensure CST date
-    df["cst_date"] = pd.to_datetime(df["snapshot_ts"], utc=True) \
-        .dt.tz_convert("US/Central") \
-        .dt.date
-
-    abs_sum = lambda x: x.abs().sum()
-
-    grouped = (
-        df.groupby(["cst_date", group_col])
+def sum_returns(df, keys, pnl_col):
+    """Σ P&L and Σ |gross| per observed key combination"""
+    return (
+        df.groupby(keys, observed=True, sort=False)
         .agg(
-            pnl=("pnl_day", "sum"),
-            gross=("gross_notional", abs_sum),
+            pnl=(pnl_col, "sum"),
+            gross=("abs_gross", "sum"),
         )
         .reset_index()
     )
 
-    grouped["ret_pct"] = 100 * grouped["pnl"] / grouped["gross"]
-    grouped["bucket"] = grouped["ret_pct"].apply(classify_move)
-
-    return grouped
+def bucket_matrix(ret, index_col, columns_col, columns):
+    """
+    Heatmap of Σ P&L ÷ Σ |gross| buckets from summed returns, one row
+    per index_col value, laid out on the given columns.
+    """
+    buckets = classify_moves(100 * ret["pnl"] / ret["gross"])
+    return (
+        ret.assign(bucket=buckets)
+        .pivot(index=index_col, columns=columns_col, values="bucket")
+        .reindex(columns=columns)
+    )
 
 # -------------------------------------------------
 # DATA LOADERS
@@ -207,18 +284,119 @@ def compute_daily_returns(df, group_col):
 @st.cache_data(ttl=60)
 def load_intraday(snapshot_date):
     sql = """
-        SELECT *
+        SELECT
+            snapshot_ts,
+            ticker,
+            quantity,
+            price_change_pct
         FROM encoredb.positions_snapshot
-        WHERE snapshot_date = %s
+        WHERE snapshot_date = %(d)s
+          AND (snapshot_ts::timestamptz AT TIME ZONE 'America/Chicago')::date = %(d)s
+          AND (snapshot_ts::timestamptz AT TIME ZONE 'America/Chicago')::time
+              BETWEEN '09:00' AND '15:59:59'
         ORDER BY snapshot_ts
     """
-    with get_conn() as conn:
-        return pd.read_sql(sql, conn, params=(snapshot_date,))
+    # CST date and trading-hours filter run in Postgres, so the frame
+    # needs no row mask afterwards
+    intraday = read_frame(
+        sql,
+        {"d": snapshot_date},
+        parse_dates={"snapshot_ts": {"utc": True}},
+    )
+
+    # Only the bucket table reads this frame: the columns its move
+    # buckets and distinct-name counts need, tickers as int codes
+    intraday["ticker"] = intraday["ticker"].astype("category")
+
+    return intraday
+
+# 30-minute CST bucket label ("09:30") of a subquery's ts_cst column
+TIME_LABEL_SQL = """to_char(
+                date_trunc('hour', p.ts_cst)
+                + FLOOR(EXTRACT(MINUTE FROM p.ts_cst) / 30) * INTERVAL '30 minutes',
+                'HH24:MI'
+            )"""
+
+@st.cache_data(ttl=60)
+def load_sector_intraday_agg(snapshot_date):
+    """
+    Sector P&L and |gross| per 30-minute CST bucket, aggregated in
+    Postgres so only one row per (bucket, sector) comes back.
+    """
+    sql = f"""
+        SELECT
+            {TIME_LABEL_SQL} AS time_label,
+            p.egm_sector_v2,
+            SUM(p.daily_pnl) AS pnl,
+            SUM(ABS(p.gross_notional)) AS gross
+        FROM (
+            SELECT
+                snapshot_ts::timestamptz AT TIME ZONE 'America/Chicago' AS ts_cst,
+                egm_sector_v2,
+                daily_pnl,
+                gross_notional
+            FROM encoredb.positions_snapshot
+            WHERE snapshot_date = %s
+              AND egm_sector_v2 IS NOT NULL
+        ) p
+        WHERE p.ts_cst::date = %s
+          AND p.ts_cst::time BETWEEN '09:00' AND '15:59:59'
+        GROUP BY 1, 2
+    """
+    return read_frame(sql, (snapshot_date, snapshot_date))
+
+@st.cache_data(ttl=60)
+def load_cohort_intraday_agg(snapshot_date, sector_name):
+    """
+    Cohort variant of load_sector_intraday_agg: positions are joined to
+    the sector's latest cohort weights and summed per (bucket, cohort)
+    server-side.
+    """
+    sql = f"""
+        WITH cohorts AS (
+            SELECT DISTINCT ON (w.instrument_id, w.cohort_id)
+                i.ticker,
+                c.cohort_name
+            FROM encoredb.instrument_cohort_weights w
+            JOIN encoredb.cohorts c ON w.cohort_id = c.cohort_id
+            JOIN encoredb.sectors s ON c.sector_id = s.sector_id
+            JOIN encoredb.instruments i ON w.instrument_id = i.instrument_id
+            WHERE s.sector_name = %s
+              AND w.effective_date <= %s
+            ORDER BY w.instrument_id, w.cohort_id, w.effective_date DESC
+        )
+        SELECT
+            {TIME_LABEL_SQL} AS time_label,
+            c.cohort_name,
+            SUM(p.daily_pnl) AS pnl,
+            SUM(ABS(p.gross_notional)) AS gross
+        FROM (
+            SELECT
+                snapshot_ts::timestamptz AT TIME ZONE 'America/Chicago' AS ts_cst,
+                ticker,
+                daily_pnl,
+                gross_notional
+            FROM encoredb.positions_snapshot
+            WHERE snapshot_date = %s
+        ) p
+        JOIN cohorts c ON c.ticker = p.ticker
+        WHERE p.ts_cst::date = %s
+          AND p.ts_cst::time BETWEEN '09:00' AND '15:59:59'
+        GROUP BY 1, 2
+    """
+    return read_frame(
+        sql, (sector_name, snapshot_date, snapshot_date, snapshot_date)
+    )
 
 @st.cache_data(ttl=300)
-def load_cohorts_for_sector(sector_name, as_of_date):
+def load_all_cohorts(as_of_date):
+    """
+    Latest weight per (instrument, cohort) as of the date for every
+    sector, so sector clicks filter a cached frame instead of querying.
+    """
     sql = """
-        SELECT
+        SELECT DISTINCT ON (w.instrument_id, w.cohort_id)
+            s.sector_name,
             i.ticker,
             c.cohort_name,
             w.weight_pct,
@@ -227,43 +405,62 @@ def load_cohorts_for_sector(sector_name, as_of_date):
         JOIN encoredb.cohorts c ON w.cohort_id = c.cohort_id
         JOIN encoredb.sectors s ON c.sector_id = s.sector_id
         JOIN encoredb.instruments i ON w.instrument_id = i.instrument_id
-        WHERE s.sector_name = %s
-          AND w.effective_date = (
-              SELECT MAX(w2.effective_date)
-              FROM encoredb.instrument_cohort_weights w2
-              WHERE w2.instrument_id = w.instrument_id
-                AND w2.cohort_id = w.cohort_id
-                AND w2.effective_date <= %s
-          )
+        WHERE w.effective_date <= %s
+        ORDER BY w.instrument_id, w.cohort_id, w.effective_date DESC
     """
-    with get_conn() as conn:
-        return pd.read_sql(sql, conn, params=(sector_name, as_of_date))
+    return read_frame(sql, (as_of_date,))
+
+@st.cache_data(ttl=300)
+def load_cohorts_for_sector(sector_name, as_of_date):
+    cohorts = load_all_cohorts(as_of_date)
+    cohorts = cohorts[cohorts["sector_name"] == sector_name].drop(columns="sector_name")
+    cohorts["cohort_name"] = cohorts["cohort_name"].astype("category")
+    return cohorts
 
 @st.cache_data(ttl=300)
-def sector_has_cohorts(sector_name):
+def load_sectors_with_cohorts():
     sql = """
-        SELECT COUNT(*) > 0
+        SELECT DISTINCT s.sector_name
         FROM encoredb.cohorts c
         JOIN encoredb.sectors s ON c.sector_id = s.sector_id
-        WHERE s.sector_name = %s
     """
-    with get_conn() as conn:
-        return pd.read_sql(sql, conn, params=(sector_name,)).iloc[0, 0]
+    return frozenset(read_frame(sql)["sector_name"])
 
-@st.cache_data(ttl=600)
-def load_intraday_history():
-    sql = """
-        SELECT *
-        FROM encoredb.positions_snapshot
-        WHERE EXTRACT(ISODOW FROM snapshot_date) BETWEEN 1 AND 5
-        ORDER BY snapshot_date, snapshot_ts
+# EOD rows with their sector (via the primary cohort), weekdays only;
+# shared by the row loader and the per-sector aggregate
+EOD_FROM_SQL = """
+        FROM encoredb.positions_eod_snapshot e
+        JOIN encoredb.instruments i
+          ON e.instrument_id = i.instrument_id
+
+        -- sector via primary cohort
+        LEFT JOIN encoredb.instrument_cohort_weights w
+          ON w.instrument_id = i.instrument_id
+         AND w.is_primary = true
+
+        LEFT JOIN encoredb.cohorts c
+          ON c.cohort_id = w.cohort_id
+
+        LEFT JOIN encoredb.sectors s
+          ON s.sector_id = c.sector_id
+
+        WHERE EXTRACT(ISODOW FROM e.snapshot_date) BETWEEN 1 AND 5
+"""
+
+@st.cache_data(ttl=60)
+def load_latest_eod_ts():
     """
-    with get_conn() as conn:
-        return pd.read_sql(sql, conn)
+    Newest EOD snapshot_ts: a cheap probe whose value keys the EOD
+    caches, so a new snapshot re-reads the history straight away. The
+    hourly TTL on those caches still picks up cohort/sector remaps and
+    corrections to existing rows, which don't move this value.
+    """
+    sql = "SELECT MAX(snapshot_ts) AS latest FROM encoredb.positions_eod_snapshot"
+    return read_frame(sql).at[0, "latest"]
 
-@st.cache_data(ttl=300)
-def load_daily_eod():
-    sql = """
+@st.cache_data(ttl=3600, max_entries=2)
+def load_daily_eod(latest_ts):
+    sql = f"""
         SELECT
             e.snapshot_date,
             e.snapshot_ts,
@@ -273,6 +470,7 @@ def load_daily_eod():
             -- position metrics
             e.quantity,
             e.gross_notional,
+            ABS(e.gross_notional) AS abs_gross,
             e.net_notional,
             e.pnl_day,
             e.effective_price_change_pct,
@@ -286,28 +484,49 @@ def load_daily_eod():
 
             -- sector (derived via cohorts)
             s.sector_name AS egm_sector_v2
-
-        FROM encoredb.positions_eod_snapshot e
-        JOIN encoredb.instruments i
-          ON e.instrument_id = i.instrument_id
-
-        -- sector via primary cohort
-        LEFT JOIN encoredb.instrument_cohort_weights w
-          ON w.instrument_id = i.instrument_id
-         AND w.is_primary = true
-
-        LEFT JOIN encoredb.cohorts c
-          ON c.cohort_id = w.cohort_id
-
-        LEFT JOIN encoredb.sectors s
-          ON s.sector_id = c.sector_id
-
-        WHERE EXTRACT(ISODOW FROM e.snapshot_date) BETWEEN 1 AND 5
+        {EOD_FROM_SQL}
         ORDER BY e.snapshot_date
     """
 
-    with get_conn() as conn:
-        return pd.read_sql(sql, conn)
+    daily = read_frame(sql)
+
+    # Group keys as category so groupbys hash int codes, not strings;
+    # the other labels repeat every day, so they shrink to codes too
+    for col in (
+        "egm_sector_v2",
+        "ticker",
+        "description",
+        "dir_short",
+        "dir_medium",
+        "dir_structural",
+        "alignment_flag",
+    ):
+        daily[col] = daily[col].astype("category")
+
+    # Only ever summed into ratios: float32 halves what groupbys read
+    for col in ("pnl_day", "gross_notional", "abs_gross"):
+        daily[col] = daily[col].astype("float32")
+
+    return daily
+
+@st.cache_data(ttl=3600, max_entries=2)
+def load_daily_sector_agg(latest_ts):
+    """
+    Σ P&L and Σ |gross| per (date, sector) over the same rows as
+    load_daily_eod, summed in Postgres for the daily sector heatmap.
+    Keyed by load_latest_eod_ts() like load_daily_eod.
+    """
+    sql = f"""
+        SELECT
+            e.snapshot_date,
+            s.sector_name AS egm_sector_v2,
+            SUM(e.pnl_day) AS pnl,
+            SUM(ABS(e.gross_notional)) AS gross
+        {EOD_FROM_SQL}
+          AND s.sector_name IS NOT NULL
+        GROUP BY 1, 2
+    """
+    return read_frame(sql)
 
 @st.cache_data(ttl=300)
 def load_return_matrix_data():
@@ -329,8 +548,7 @@ def load_return_matrix_data():
         ORDER BY i.instrument_id, p.trade_date
     """
 
-    with get_conn() as conn:
-        return pd.read_sql(sql, conn)
+    return read_frame(sql)
         
 # -------------------------------------------------
 # MOVE BUCKETS
@@ -351,6 +569,30 @@ BUCKET_ORDER = [
     "< 1% down", "1–2% down", "2–3% down", "> 3% down",
 ]
 
+# Bucket edges for classify_move: on the down side a move equal to
+# the edge belongs to the bucket above it, on the up side to the one below
+MOVE_EDGES_DOWN = np.array([-3.0, -2.0, -1.0, 0.0])
+MOVE_EDGES_UP = np.array([1.0, 2.0, 3.0])
+
+def bucket_codes(values):
+    """
+    Vectorized classify_move: integer position in BUCKET_ORDER
+    for every value (same boundaries, NaN -> "< 1% up").
+    """
+    x = np.asarray(values, dtype="float64")
+    x = np.where(np.isnan(x), 0.0, x)
+    rank = (
+        np.searchsorted(MOVE_EDGES_DOWN, x, side="right")
+        + np.searchsorted(MOVE_EDGES_UP, x, side="left")
+    )
+    return (len(BUCKET_ORDER) - 1 - rank).astype("int8")
+
+def classify_moves(values):
+    """Bucket a whole column at once, as a Categorical over BUCKET_ORDER"""
+    return pd.Categorical.from_codes(
+        bucket_codes(values), BUCKET_ORDER, ordered=True
+    )
+
 BUCKET_SYMBOL = {
     "> 3% up": "▲▲▲▲",
     "2–3% up": "▲▲▲",
@@ -400,10 +642,68 @@ def return_to_bucket(ret_pct):
         return "2–3% down"
 
     return "> 3% down"
+
+def return_buckets(values):
+    """
+    Vectorized return_to_bucket, as a Categorical over BUCKET_ORDER like
+    classify_moves. Unlike classify_move a return exactly on -1/-2/-3
+    drops into the lower bucket, and NaN stays missing (code -1).
+    """
+    x = np.asarray(values, dtype="float64")
+    rank = (
+        np.searchsorted(MOVE_EDGES_DOWN, x, side="left")
+        + (x == 0)
+        + np.searchsorted(MOVE_EDGES_UP, x, side="left")
+    )
+    codes = np.where(np.isnan(x), -1, len(BUCKET_ORDER) - 1 - rank)
+    return pd.Categorical.from_codes(
+        codes.astype("int8"), BUCKET_ORDER, ordered=True
+    )
     
 # -------------------------------------------------
 # HEATMAP
 # -------------------------------------------------
+BUCKET_DTYPE = pd.CategoricalDtype(BUCKET_ORDER, ordered=True)
+BUCKET_INDEX = pd.Index(BUCKET_ORDER)
+
+# Render lookup tables by bucket code; the extra last entry is what
+# code -1 (no data) indexes
+SYMBOL_LUT = np.array(
+    [BUCKET_SYMBOL[b] for b in BUCKET_ORDER] + [""], dtype=object
+)
+CSS_LUT = np.array(
+    [f"color:{BUCKET_COLOR[b]}" for b in BUCKET_ORDER] + ["color:#000"],
+    dtype=object,
+)
+
+def bucket_code_matrix(df):
+    """
+    Integer bucket codes of a heatmap matrix. Bucket columns are
+    normally categoricals over BUCKET_ORDER; any label column that is
+    not is matched against BUCKET_ORDER, so unknown labels and the
+    all-empty columns added by a reindex stay -1.
+    """
+    codes = np.full(df.shape, -1, dtype="int8")
+    for j, (_, col) in enumerate(df.items()):
+        if col.dtype == BUCKET_DTYPE:
+            codes[:, j] = col.cat.codes
+        else:
+            codes[:, j] = BUCKET_INDEX.get_indexer(col.to_numpy(dtype=object))
+    return codes
+
+@st.cache_data(ttl=300, max_entries=64)
+def heatmap_frames(df):
+    """
+    Arrow and CSS frames for a heatmap matrix. Keyed on the matrix
+    contents, so reruns with unchanged data skip the lookups.
+    """
+    # Cells are bucket codes (-1 = empty); arrows and colours come from
+    # indexing the lookup tables
+    codes = bucket_code_matrix(df)
+    symbols = pd.DataFrame(SYMBOL_LUT[codes], index=df.index, columns=df.columns)
+    css = pd.DataFrame(CSS_LUT[codes], index=df.index, columns=df.columns)
+    return symbols, css
+
 def render_heatmap(df, title):
 
     st.markdown(f"**{title}**")
@@ -412,156 +712,215 @@ def render_heatmap(df, title):
         st.info("No data available.")
         return
 
-    html = """
-    <div style="
-        background:white;
-        padding:6px;
-        border-radius:6px;
-        overflow-x:auto;
-        overflow-y:auto;
-        max-height:700px;
-        border:1px solid #eee;
-    ">
-      <table style="
-        width:max-content;
-        min-width:100%;
-        border-collapse:collapse;
-        font-size:12px;
-      ">
-        <thead>
-          <tr>
-            <th style="
-                text-align:left;
-                padding:4px;
-                position:sticky;
-                left:0;
-                top:0;
-                background:white;
-                z-index:4;
-                border-bottom:1px solid #ddd;
-            ">
-              Name
-            </th>
-    """
+    # The Styler gets the whole CSS frame in one call
+    symbols, css = heatmap_frames(df)
+    styled = symbols.style.apply(lambda _: css, axis=None)
 
-    for c in df.columns:
-        html += f"""
-        <th style="
-            padding:4px;
-            text-align:center;
-            white-space:nowrap;
-            position:sticky;
-            top:0;
-            background:white;
-            z-index:3;
-            border-bottom:1px solid #ddd;
-        ">
-            {c}
-        </th>
-        """
+    st.dataframe(
+        styled,
+        width="stretch",
+        height=min(520, 38 + 35 * len(df)),
+    )
 
-    html += """
-          </tr>
-        </thead>
-        <tbody>
-    """
+# -------------------------------------------------
+# LOAD DATA
+# -------------------------------------------------
+# "HH:MM" of every half hour, indexed by hour * 2 + minute // 30
+HALF_HOUR_LABELS = np.array(
+    [f"{h:02d}:{m:02d}" for h in range(24) for m in (0, 30)],
+    dtype=object,
+)
 
-    for idx, row in df.iterrows():
-
-        html += f"""
-        <tr>
-          <td style="
-              padding:4px;
-              font-weight:600;
-              position:sticky;
-              left:0;
-              background:white;
-              z-index:2;
-              border-right:1px solid #ddd;
-              white-space:nowrap;
-          ">
-              {idx}
-          </td>
-        """
+def add_move_columns(df):
+    """Add the sign-adjusted % move and its bucket in place"""
+    # Shorts benefit from declines: scale to % and flip sign in one pass
+    sign = np.where(df["quantity"].to_numpy() < 0, -100.0, 100.0)
+    df["effective_price_change_pct"] = (
+        df["price_change_pct"].to_numpy(dtype="float64") * sign
+    )
+    df["move_bucket"] = classify_moves(df["effective_price_change_pct"])
 
-        for v in row:
-
-            html += f"""
-            <td style="
-                padding:4px;
-                text-align:center;
-                color:{BUCKET_COLOR.get(v,'#000')};
-                white-space:nowrap;
-            ">
-                {BUCKET_SYMBOL.get(v,'')}
-            </td>
-            """
+def load_intraday_frame(snapshot_date):
+    """
+    Intraday positions within trading hours, with time buckets and move
+    columns. Drill-downs read load_latest_positions instead.
+    """
+    # snapshot_ts arrives as UTC datetime64 from the (cached) loader,
+    # already limited to the CST date and trading hours
+    intraday = load_intraday(snapshot_date)
+
+    # Convert once to CST (authoritative timestamp)
+    try:
+        cst = intraday["snapshot_ts"].dt.tz_convert("America/Chicago")
+    except Exception:
+        # fallback: keep UTC if timezone database missing
+        cst = intraday["snapshot_ts"]
+    intraday["snapshot_cst"] = cst
+
+    # Fixed 30-minute buckets for heatmaps, as codes into the label table
+    intraday["time_label"] = pd.Categorical.from_codes(
+        cst.dt.hour.to_numpy() * 2 + cst.dt.minute.to_numpy() // 30,
+        HALF_HOUR_LABELS,
+        ordered=True,
+    )
 
-        html += "</tr>"
+    add_move_columns(intraday)
 
-    html += """
-        </tbody>
-      </table>
-    </div>
-    """
+    return intraday
 
-    components.html(
-        html,
-        height=min(520, 60 + 26 * len(df)),
-        scrolling=False
+@st.cache_data(ttl=60)
+def load_latest_positions(snapshot_date):
+    """
+    Rows of the day's latest snapshot within trading hours, for the
+    drill-downs that need nothing else. Postgres picks the snapshot,
+    so only its rows are transferred instead of the whole day.
+    """
+    sql = """
+        WITH day AS (
+            SELECT
+                snapshot_ts,
+                ticker,
+                description,
+                egm_sector_v2,
+                quantity,
+                price_change_pct,
+                daily_pnl,
+                gross_notional,
+                nmv
+            FROM encoredb.positions_snapshot
+            WHERE snapshot_date = %(d)s
+              AND (snapshot_ts::timestamptz AT TIME ZONE 'America/Chicago')::date = %(d)s
+              AND (snapshot_ts::timestamptz AT TIME ZONE 'America/Chicago')::time
+                  BETWEEN '09:00' AND '15:59:59'
+        )
+        SELECT *
+        FROM day
+        WHERE snapshot_ts = (SELECT MAX(snapshot_ts) FROM day)
+    """
+    latest = read_frame(
+        sql,
+        {"d": snapshot_date},
+        parse_dates={"snapshot_ts": {"utc": True}},
     )
-    
+
+    add_move_columns(latest)
+
+    # Drill-downs filter these repeatedly; compare category codes
+    for col in ("egm_sector_v2", "ticker"):
+        latest[col] = latest[col].astype("category")
+
+    return latest
+
 # -------------------------------------------------
-# LOAD DATA
+# INTRADAY HEATMAP MATRICES
 # -------------------------------------------------
-intraday = load_intraday(selected_date)
+# Pure functions of the snapshot date (and sector), so selectbox
+# reruns reuse the cached matrix instead of re-aggregating
+@st.cache_data(ttl=60)
+def compute_sector_matrix(snapshot_date):
+    return bucket_matrix(
+        load_sector_intraday_agg(snapshot_date),
+        "egm_sector_v2",
+        "time_label",
+        TIME_GRID,
+    )
 
-from datetime import time
+@st.cache_data(ttl=60)
+def load_cohort_positions(snapshot_date, sector_name):
+    """
+    Latest-snapshot rows joined (inner) to the sector's cohorts for the
+    instrument drill-downs; the cohort heatmap is aggregated in SQL.
+    Tickers share one categorical dtype on both sides so the join runs
+    on integer codes.
+    """
+    latest = load_latest_positions(snapshot_date)
+    cohorts = load_cohorts_for_sector(sector_name, snapshot_date)
 
-TRADING_START = time(9, 0)
-TRADING_END   = time(15, 59, 59)
+    ticker_dtype = pd.CategoricalDtype(cohorts["ticker"].dropna().unique())
+    cohorts["ticker"] = cohorts["ticker"].astype(ticker_dtype)
 
-intraday["snapshot_ts"] = pd.to_datetime(intraday["snapshot_ts"], utc=True)
+    latest = latest[latest["ticker"].isin(ticker_dtype.categories)]
+    return (
+        latest.assign(ticker=latest["ticker"].astype(ticker_dtype))
+        .merge(cohorts, on="ticker", how="inner")
+    )
 
-# Convert once to CST (authoritative timestamp)
-try:
-    intraday["snapshot_cst"] = intraday["snapshot_ts"].dt.tz_convert("America/Chicago")
-except Exception:
-    # fallback: keep UTC if timezone database missing
-    intraday["snapshot_cst"] = intraday["snapshot_ts"]
+@st.cache_data(ttl=300)
+def load_daily_cohort_rows(latest_ts, sector_name, as_of_date):
+    """
+    EOD rows joined (inner) to the sector's cohorts, shared by the
+    daily cohort heatmap and its drill-down. The cohort tickers take
+    the EOD ticker dtype so the join runs on category codes. Keyed by
+    load_latest_eod_ts() like load_daily_eod.
+    """
+    daily = load_daily_eod(latest_ts)
+    cohorts = load_cohorts_for_sector(sector_name, as_of_date)
 
-# Filter to selected CST date
-intraday = intraday[
-    intraday["snapshot_cst"].dt.date == selected_date
-].copy()
+    ticker_dtype = daily["ticker"].dtype
+    cohorts = cohorts[cohorts["ticker"].isin(ticker_dtype.categories)]
 
-# Filter to regular trading hours (09:00–15:00 CST)
-intraday = intraday[
-    intraday["snapshot_cst"].dt.time.between(
-        TRADING_START,
-        TRADING_END
+    return daily.merge(
+        cohorts.assign(ticker=cohorts["ticker"].astype(ticker_dtype)),
+        on="ticker",
+        how="inner",
     )
-].copy()
 
-# Fixed 30-minute buckets for heatmaps
-intraday["time_label"] = (
-    intraday["snapshot_cst"]
-    .dt.floor("30min")
-    .dt.strftime("%H:%M")
-)
+@st.cache_data(ttl=60)
+def compute_cohort_matrix(snapshot_date, sector_name):
+    return bucket_matrix(
+        load_cohort_intraday_agg(snapshot_date, sector_name),
+        "cohort_name",
+        "time_label",
+        TIME_GRID,
+    )
+
+@st.cache_data(ttl=60)
+def compute_bucket_table(snapshot_date):
+    """Distinct names per (move bucket, half hour) over TIME_GRID"""
+    intraday = load_intraday_frame(snapshot_date)
+
+    # Both keys are categorical, so every bucket row and half hour
+    # comes out without a reindex
+    unique_names = intraday.drop_duplicates(
+        ["time_label", "move_bucket", "ticker"]
+    )
 
-intraday["effective_price_change_pct"] = intraday["price_change_pct"] * 100
-intraday.loc[intraday["quantity"] < 0, "effective_price_change_pct"] *= -1
-intraday["move_bucket"] = intraday["effective_price_change_pct"].apply(classify_move)
+    return pd.crosstab(
+        unique_names["move_bucket"],
+        unique_names["time_label"],
+        dropna=False,
+    )[TIME_GRID].astype("Int64")
+
+@st.cache_data(ttl=60)
+def compute_price_sector_views(snapshot_date):
+    """
+    Latest-snapshot sector breakdown for every move bucket at once, so
+    picking a bucket is a lookup rather than a fresh groupby.
+    """
+    return (
+        load_latest_positions(snapshot_date)
+        .groupby(["move_bucket", "egm_sector_v2"], observed=True, sort=False)
+        .agg(
+            names=("ticker", "nunique"),
+            net_nmv=("nmv", "sum"),
+            avg_move=("effective_price_change_pct", "mean"),
+        )
+        .reset_index()
+        .sort_values("net_nmv", ascending=False)
+    )
 
 # -------------------------------------------------
-# DEFINE LATEST SNAPSHOT *WITHIN TRADING HOURS*
+# DAILY (EOD) AGGREGATES
 # -------------------------------------------------
-latest_ts = intraday["snapshot_cst"].max()
-
-latest = intraday[
-    intraday["snapshot_cst"] == latest_ts
-].copy()
+# Only the visible window changes with the slider, so the sums are
+# cached and each rerun just pivots them (sector sums come from SQL)
+@st.cache_data(ttl=300)
+def compute_daily_cohort_returns(latest_ts, sector_name, as_of_date):
+    return sum_returns(
+        load_daily_cohort_rows(latest_ts, sector_name, as_of_date),
+        ["snapshot_date", "cohort_name"],
+        "pnl_day",
+    )
 
 # -------------------------------------------------
 # TABS
@@ -630,27 +989,7 @@ if active_tab == "🏭 Sector Driven":
     # -------------------------------
     with st.container():
 
-        sector_ret = (
-            intraday
-            .groupby(["time_label", "egm_sector_v2"])
-            .agg(
-                pnl=("daily_pnl", "sum"),
-                gross=("gross_notional", lambda x: x.abs().sum()),
-            )
-            .reset_index()
-        )
-
-        sector_ret["bucket"] = (
-            100 * sector_ret["pnl"] / sector_ret["gross"]
-        ).apply(classify_move)
-
-        TIME_GRID = TIME_BUCKETS
-
-        sector_matrix = (
-            sector_ret
-            .pivot(index="egm_sector_v2", columns="time_label", values="bucket")
-            .reindex(columns=TIME_GRID)
-        )
+        sector_matrix = compute_sector_matrix(selected_date)
 
         render_heatmap(sector_matrix, "🏭 Sector Heatmap")
 
@@ -665,29 +1004,10 @@ if active_tab == "🏭 Sector Driven":
     # -------------------------------
     with st.container():
 
-        if sector_has_cohorts(sel_sector):
+        if sel_sector in load_sectors_with_cohorts():
 
-            cohorts = load_cohorts_for_sector(sel_sector, selected_date)
-            ct = intraday.merge(cohorts, on="ticker", how="inner")
-
-            cohort_ret = (
-                ct.groupby(["time_label", "cohort_name"])
-                .agg(
-                    pnl=("daily_pnl", "sum"),
-                    gross=("gross_notional", lambda x: x.abs().sum()),
-                )
-                .reset_index()
-            )
-
-            cohort_ret["bucket"] = (
-                100 * cohort_ret["pnl"] / cohort_ret["gross"]
-            ).apply(classify_move)
-
-            cohort_matrix = (
-                cohort_ret
-                .pivot(index="cohort_name", columns="time_label", values="bucket")
-                .reindex(columns=TIME_GRID)
-            )
+            cohort_latest = load_cohort_positions(selected_date, sel_sector)
+            cohort_matrix = compute_cohort_matrix(selected_date, sel_sector)
 
             render_heatmap(cohort_matrix, f"🧩 {sel_sector} — Cohorts")
 
@@ -697,10 +1017,7 @@ if active_tab == "🏭 Sector Driven":
                 key="intraday_cohort_select",
             )
 
-            cohort_latest = (
-                latest.merge(cohorts, on="ticker", how="inner")
-                .query("cohort_name == @sel_cohort")
-            )
+            cohort_latest = cohort_latest.query("cohort_name == @sel_cohort")
 
             st.markdown(f"**📋 Instrument Detail — {sel_cohort}**")
 
@@ -725,6 +1042,8 @@ if active_tab == "🏭 Sector Driven":
         else:
             st.markdown(f"**📋 Instrument Detail — {sel_sector}**")
 
+            latest = load_latest_positions(selected_date)
+
             df = safe_select(
                 latest[latest["egm_sector_v2"] == sel_sector],
                 [
@@ -765,7 +1084,9 @@ elif active_tab == "📆 Daily Sector Driven":
     # -------------------------------
     # LOAD EOD DATA
     # -------------------------------
-    daily = load_daily_eod()
+    # Only the probe runs each rerun; the history reloads on a new snapshot
+    eod_ts = load_latest_eod_ts()
+    daily = load_daily_eod(eod_ts)
 
     if daily.empty:
         st.info("No daily EOD data available.")
@@ -791,30 +1112,13 @@ elif active_tab == "📆 Daily Sector Driven":
     # -------------------------------
     # DAILY SECTOR AGGREGATION
     # -------------------------------
-    sector_daily = (
-        daily
-        .groupby(["snapshot_date", "egm_sector_v2"])
-        .agg(
-            pnl=("pnl_day", "sum"),
-            gross=("gross_notional", lambda x: x.abs().sum()),
-        )
-        .reset_index()
-    )
-
-    sector_daily["ret_pct"] = 100 * sector_daily["pnl"] / sector_daily["gross"]
-    sector_daily["bucket"] = sector_daily["ret_pct"].apply(classify_move)
+    sector_daily = load_daily_sector_agg(eod_ts)
 
     # -------------------------------
     # SECTOR HEATMAP
     # -------------------------------
-    sector_matrix = (
-        sector_daily
-        .pivot(
-            index="egm_sector_v2",
-            columns="snapshot_date",
-            values="bucket",
-        )
-        .reindex(columns=visible_dates)
+    sector_matrix = bucket_matrix(
+        sector_daily, "egm_sector_v2", "snapshot_date", visible_dates
     )
 
     render_heatmap(sector_matrix, "📆 Daily Sector Trend")
@@ -831,37 +1135,20 @@ elif active_tab == "📆 Daily Sector Driven":
     sector_rows = daily[
         (daily["egm_sector_v2"] == sel_sector)
         & (daily["snapshot_date"] == latest_day)
-    ].copy()
+    ]
 
     # -------------------------------
     # COHORT / INSTRUMENT VIEW
     # -------------------------------
-    if sector_has_cohorts(sel_sector):
+    if sel_sector in load_sectors_with_cohorts():
 
-        cohorts = load_cohorts_for_sector(sel_sector, latest_day)
+        daily_ct = load_daily_cohort_rows(eod_ts, sel_sector, latest_day)
 
         # ---------- COHORT DAILY ----------
-        cohort_daily = (
-            daily.merge(cohorts, on="ticker", how="inner")
-            .groupby(["snapshot_date", "cohort_name"])
-            .agg(
-                pnl=("pnl_day", "sum"),
-                gross=("gross_notional", lambda x: x.abs().sum()),
-            )
-            .reset_index()
-        )
+        cohort_daily = compute_daily_cohort_returns(eod_ts, sel_sector, latest_day)
 
-        cohort_daily["ret_pct"] = 100 * cohort_daily["pnl"] / cohort_daily["gross"]
-        cohort_daily["bucket"] = cohort_daily["ret_pct"].apply(classify_move)
-
-        cohort_matrix = (
-            cohort_daily
-            .pivot(
-                index="cohort_name",
-                columns="snapshot_date",
-                values="bucket",
-            )
-            .reindex(columns=visible_dates)
+        cohort_matrix = bucket_matrix(
+            cohort_daily, "cohort_name", "snapshot_date", visible_dates
         )
 
         render_heatmap(cohort_matrix, f"📆 {sel_sector} — Daily Cohorts")
@@ -872,11 +1159,11 @@ elif active_tab == "📆 Daily Sector Driven":
             key="daily_cohort_select",
         )
 
-        instrument_rows = (
-            sector_rows
-            .merge(cohorts, on="ticker", how="inner")
-            .query("cohort_name == @sel_cohort")
-        )
+        instrument_rows = daily_ct[
+            (daily_ct["egm_sector_v2"] == sel_sector)
+            & (daily_ct["snapshot_date"] == latest_day)
+            & (daily_ct["cohort_name"] == sel_cohort)
+        ]
 
         st.markdown(
             f"**📋 Instrument Contribution — {sel_cohort} ({latest_day})**"
@@ -928,27 +1215,20 @@ elif active_tab == "📈 Price Change Driven":
 
     st.header("📈 Price Change–Driven Analysis")
 
+    latest = load_latest_positions(selected_date)
+
     # --------------------------------
     # PRICE MOVE DISTRIBUTION
     # --------------------------------
-    bucket_table = (
-        intraday
-        .groupby(["time_label", "move_bucket"])
-        .agg(names=("ticker", "nunique"))
-        .reset_index()
-        .pivot(index="move_bucket", columns="time_label", values="names")
-        .reindex(index=BUCKET_ORDER, columns=TIME_GRID)
-    )
-
-    from zoneinfo import ZoneInfo
-    
-    now_cst = datetime.now(ZoneInfo("America/Chicago")).strftime("%H:%M")
-
-    past_cols = [c for c in bucket_table.columns if c <= now_cst]
-    future_cols = [c for c in bucket_table.columns if c > now_cst]
+    bucket_table = compute_bucket_table(selected_date)
 
-    bucket_table[past_cols] = bucket_table[past_cols].fillna(0)
-    bucket_table[past_cols] = bucket_table[past_cols].astype("Int64")
+    # Zero counts only mean something for half hours already reached,
+    # so blank today's later columns; past dates show the full session.
+    # .loc keeps the masked columns nullable Int64 like the rest
+    if is_today:
+        now_cst = datetime.now(ZoneInfo("America/Chicago")).strftime("%H:%M")
+        future_cols = [c for c in bucket_table.columns if c > now_cst]
+        bucket_table.loc[:, future_cols] = pd.NA
 
     st.dataframe(bucket_table, width="stretch")
 
@@ -965,16 +1245,11 @@ elif active_tab == "📈 Price Change Driven":
     # --------------------------------
     # SECTOR BREAKDOWN
     # --------------------------------
+    sector_views = compute_price_sector_views(selected_date)
     sector_view = (
-        bucket_df
-        .groupby("egm_sector_v2")
-        .agg(
-            names=("ticker", "nunique"),
-            net_nmv=("nmv", "sum"),
-            avg_move=("effective_price_change_pct", "mean"),
-        )
-        .reset_index()
-        .sort_values("net_nmv", ascending=False)
+        sector_views[sector_views["move_bucket"] == sel_bucket]
+        .drop(columns="move_bucket")
+        .reset_index(drop=True)
     )
 
     st.subheader(f"🏭 Sector Breakdown — {sel_bucket}")
@@ -995,20 +1270,22 @@ elif active_tab == "📈 Price Change Driven":
     # --------------------------------
     # COHORT HANDLING (ROBUST VERSION)
     # --------------------------------
-    if sector_has_cohorts(sel_sector):
+    if sel_sector in load_sectors_with_cohorts():
 
-        cohorts = load_cohorts_for_sector(sel_sector, selected_date)
+        cohort_latest = load_cohort_positions(selected_date, sel_sector)
 
-        # 🔥 LEFT JOIN (not inner)
-        ct_df = sector_df.merge(cohorts, on="ticker", how="left")
+        # Cohort-matched rows of this bucket + sector (the rest fall back below)
+        ct_df = cohort_latest[
+            (cohort_latest["move_bucket"] == sel_bucket)
+            & (cohort_latest["egm_sector_v2"] == sel_sector)
+        ]
 
         # Only proceed if real cohort matches exist
-        if "cohort_name" in ct_df.columns and ct_df["cohort_name"].notna().any():
+        if not ct_df.empty:
 
             cohort_view = (
                 ct_df
-                .dropna(subset=["cohort_name"])
-                .groupby("cohort_name")
+                .groupby("cohort_name", observed=True, sort=False)
                 .agg(
                     names=("ticker", "nunique"),
                     net_nmv=("nmv", "sum"),
@@ -1106,14 +1383,12 @@ elif active_tab == "📅 Return Matrix":
     # Convert log return -> %
     # -----------------------------------------
 
-    import numpy as np
-
     returns = returns.sort_values(
         ["instrument_id", "trade_date"]
     )
 
     returns["return_pct"] = (
-        returns.groupby("instrument_id")["close_price"]
+        returns.groupby("instrument_id", sort=False)["close_price"]
         .pct_change()
         * 100
     )
@@ -1169,11 +1444,7 @@ elif active_tab == "📅 Return Matrix":
             )
         """
 
-        with get_conn() as conn:
-            holdings = pd.read_sql(
-                holdings_sql,
-                conn
-            )
+        holdings = read_frame(holdings_sql)
 
         holdings_returns = returns.merge(
             holdings,
@@ -1181,9 +1452,8 @@ elif active_tab == "📅 Return Matrix":
             how="inner"
         )
 
-        holdings_returns["bucket"] = (
+        holdings_returns["bucket"] = return_buckets(
             holdings_returns["return_pct"]
-            .apply(return_to_bucket)
         )
 
         matrix = (
@@ -1250,9 +1520,8 @@ elif active_tab == "📅 Return Matrix":
                 )
             ]
 
-        universe_returns["bucket"] = (
+        universe_returns["bucket"] = return_buckets(
             universe_returns["return_pct"]
-            .apply(return_to_bucket)
         )
 
         matrix = (
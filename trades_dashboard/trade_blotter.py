@@ -1,8 +1,10 @@
 import streamlit as st
 import pandas as pd
+import numpy as np
 import psycopg2
-from psycopg2.extras import RealDictCursor
-from decimal import Decimal, ROUND_HALF_UP
+from psycopg2.pool import PoolError, ThreadedConnectionPool
+from contextlib import contextmanager
+from threading import BoundedSemaphore
 
 # -------------------------------------------------
 # SIMPLE PASSWORD AUTH
@@ -10,25 +12,23 @@ from decimal import Decimal, ROUND_HALF_UP
 
 def check_password():
 
-    def password_entered():
-        if st.session_state["password"] == st.secrets["auth"]["password"]:
-            st.session_state["authenticated"] = True
-        else:
-            st.session_state["authenticated"] = False
+    if st.session_state.get("authenticated"):
+        return True
 
-    if "authenticated" not in st.session_state:
-        st.text_input("Enter Password", type="password", key="password")
-        st.button("Login", on_click=password_entered)
-        return False
+    # One form: the password is only sent when Login is pressed
+    with st.form("login"):
+        password = st.text_input("Enter Password", type="password")
+        submitted = st.form_submit_button("Login")
 
-    elif not st.session_state["authenticated"]:
-        st.text_input("Enter Password", type="password", key="password")
-        st.button("Login", on_click=password_entered)
+    if submitted:
+        st.session_state["authenticated"] = (
+            password == st.secrets["auth"]["password"]
+        )
+        if st.session_state["authenticated"]:
+            st.rerun()  # drop the login form before the app renders
         st.error("Incorrect password")
-        return False
 
-    else:
-        return True
+    return False
 
 
 if not check_password():
@@ -40,162 +40,295 @@ if not check_password():
 
 DB_CONFIG = st.secrets["db"]
 
+NUMERIC_AS_FLOAT = psycopg2.extensions.new_type(
+    psycopg2.extensions.DECIMAL.values,
+    "NUMERIC_AS_FLOAT",
+    lambda value, cur: float(value) if value is not None else None,
+)
+
+POOL_MAXCONN = 10
+POOL_WAIT_SECONDS = 30
+
+@st.cache_resource
+def get_pool():
+    # One pool shared across reruns and sessions
+    return ThreadedConnectionPool(1, POOL_MAXCONN, **DB_CONFIG)
+
+@st.cache_resource
+def get_pool_slots():
+    # getconn() raises rather than waits once every connection is out,
+    # so callers queue here for a free one first
+    return BoundedSemaphore(POOL_MAXCONN)
+
+@contextmanager
 def get_conn():
-    return psycopg2.connect(**DB_CONFIG)
+    """
+    Borrow a pooled connection for the block (one transaction),
+    then hand it back; broken connections are discarded.
+    """
+    slots = get_pool_slots()
+    if not slots.acquire(timeout=POOL_WAIT_SECONDS):
+        raise PoolError(
+            f"no database connection free after {POOL_WAIT_SECONDS}s"
+        )
+
+    try:
+        pool = get_pool()
+        conn = pool.getconn()
+        try:
+            # NUMERIC straight to float: no Decimal objects per cell
+            psycopg2.extensions.register_type(NUMERIC_AS_FLOAT, conn)
+            with conn:
+                yield conn
+        finally:
+            pool.putconn(conn, close=bool(conn.closed))
+    finally:
+        slots.release()
 
 # ==========================================================
 # DATABASE HELPERS
 # ==========================================================
 
+@st.cache_data(ttl=300)
 def get_all_tickers():
-    conn = get_conn()
-    cursor = conn.cursor()
-    cursor.execute("""
-        SELECT DISTINCT i.ticker
-        FROM encoredb.trades t
-        JOIN encoredb.instruments i
-            ON t.instrument_id = i.instrument_id
-        ORDER BY i.ticker
-    """)
-    rows = cursor.fetchall()
-    cursor.close()
-    conn.close()
+    with get_conn() as conn:
+        with conn.cursor() as cursor:
+            # Semi-join: one probe per instrument instead of joining
+            # every trade and de-duplicating
+            cursor.execute("""
+                SELECT DISTINCT i.ticker
+                FROM encoredb.instruments i
+                WHERE EXISTS (
+                    SELECT 1
+                    FROM encoredb.trades t
+                    WHERE t.instrument_id = i.instrument_id
+                )
+                ORDER BY i.ticker
+            """)
+            rows = cursor.fetchall()
     return [r[0] for r in rows]
 
 
+# Rows pulled per round-trip from the server-side trades cursor
+TRADE_BATCH_ROWS = 10_000
+
+@st.cache_data(ttl=300)
+def load_all_trades():
+    """
+    Every trade in one query, split into a frame per ticker so that
+    switching tickers never goes back to the database.
+    """
+    batches = []
+
+    with get_conn() as conn:
+        # Named (server-side) cursor: rows stream over in batches rather
+        # than the whole result being buffered client-side in one go
+        with conn.cursor(name="all_trades") as cursor:
+
+            cursor.execute("""
+                SELECT
+                    t.trade_id,
+                    t.trade_date,
+                    i.ticker,
+                    t.quantity,
+                    t.price
+                FROM encoredb.trades t
+                JOIN encoredb.instruments i
+                    ON t.instrument_id = i.instrument_id
+                ORDER BY i.ticker, t.trade_date, t.trade_id
+            """)
+
+            while True:
+                rows = cursor.fetchmany(TRADE_BATCH_ROWS)
+                if not rows:
+                    break
+
+                # Plain tuples straight into typed columns; quantity
+                # and price already arrive as floats
+                batches.append(pd.DataFrame.from_records(
+                    rows,
+                    columns=[d[0] for d in cursor.description],
+                ))
+
+    if not batches:
+        return {}
+
+    df = pd.concat(batches, ignore_index=True)
+
+    return {
+        ticker: trades.reset_index(drop=True)
+        for ticker, trades in df.groupby("ticker", sort=False)
+    }
+
+@st.cache_data(ttl=300)
 def load_trades_for_ticker(ticker):
-    conn = get_conn()
-    cursor = conn.cursor(cursor_factory=RealDictCursor)
-
-    cursor.execute("""
-        SELECT
-            t.trade_id,
-            t.trade_date,
-            i.ticker,
-            t.quantity,
-            t.price
-        FROM encoredb.trades t
-        JOIN encoredb.instruments i
-            ON t.instrument_id = i.instrument_id
-        WHERE i.ticker = %s
-        ORDER BY t.trade_date, t.trade_id
-    """, (ticker,))
-
-    rows = cursor.fetchall()
-    cursor.close()
-    conn.close()
-
-    return pd.DataFrame(rows)
+    # Cached per ticker too, so a rerun copies back one ticker's trades
+    # rather than the whole map
+    trades = load_all_trades().get(ticker)
+    return trades if trades is not None else pd.DataFrame()
 
 # ==========================================================
 # FIFO ENGINE
 # ==========================================================
 
-def build_fifo_ledger(df):
-
-    open_long_lots = []
-    open_short_lots = []
-
-    running_position = Decimal("0")
-    realized_pnl_total = Decimal("0")
-
-    ledger_rows = []
-
-    for _, row in df.iterrows():
-
-        qty = Decimal(str(row["quantity"]))
-        price = Decimal(str(row["price"]))
-
-        trade_notional = qty * price
-        realized_pnl = Decimal("0")
+# Quantities at or below this are float residue of fractional fills,
+# not shares: a lot that small is closed, a remainder that small dropped
+LOT_EPS = 1e-6
+
+# Side labels by the code fifo_kernel emits per trade
+SIDE_LABELS = np.array([
+    "BUY (Open Long)",
+    "BUY (Cover Short)",
+    "SELL (Close Long)",
+    "SELL (Open Short)",
+])
+
+def fifo_kernel(qty, price):
+    """
+    FIFO-match trades given as float64 quantity/price arrays (in trade
+    order). Returns per-trade side codes, running position, realized
+    PnL, cumulative realized PnL and unrealized PnL as arrays.
+    """
+    n = len(qty)
+
+    # Open lots per side as parallel qty/price buffers; lots are consumed
+    # from head and appended at tail, so closing a lot is head += 1.
+    # Each trade opens at most one lot, so n slots always suffice.
+    long_qty, long_price = np.empty(n), np.empty(n)
+    short_qty, short_price = np.empty(n), np.empty(n)
+    long_head = long_tail = 0
+    short_head = short_tail = 0
+
+    # Σ qty and Σ qty × price of each side's open lots, kept up to date
+    # as lots open and fill rather than re-summed every trade
+    long_open = short_open = 0.0
+    long_cost = short_cost = 0.0
+
+    side_code = np.empty(n, dtype=np.int8)
+    running = np.empty(n)
+    realized = np.empty(n)
+    realized_total = np.empty(n)
+    unrealized = np.empty(n)
+
+    running_position = 0.0
+    realized_pnl_total = 0.0
+
+    for i in range(n):
+
+        q = qty[i]
+        p = price[i]
+        realized_pnl = 0.0
 
         # BUY
-        if qty > 0:
+        if q > 0:
 
-            buy_qty = qty
-            side_label = "BUY (Open Long)" if not open_short_lots else "BUY (Cover Short)"
+            buy_qty = q
+            side_code[i] = 1 if short_head < short_tail else 0
 
-            while buy_qty > 0 and open_short_lots:
-                lot = open_short_lots[0]
-                matched = min(lot["remaining_qty"], buy_qty)
+            while buy_qty > LOT_EPS and short_head < short_tail:
+                matched = min(short_qty[short_head], buy_qty)
 
-                pnl = matched * (lot["price"] - price)
-                realized_pnl += pnl
+                realized_pnl += matched * (short_price[short_head] - p)
+                short_open -= matched
+                short_cost -= matched * short_price[short_head]
 
-                lot["remaining_qty"] -= matched
+                short_qty[short_head] -= matched
                 buy_qty -= matched
 
-                if lot["remaining_qty"] == 0:
-                    open_short_lots.pop(0)
+                if short_qty[short_head] <= LOT_EPS:
+                    short_head += 1
 
-            if buy_qty > 0:
-                open_long_lots.append({
-                    "remaining_qty": buy_qty,
-                    "price": price
-                })
+            if short_head == short_tail:
+                short_open = short_cost = 0.0  # no residue on a flat side
 
-            running_position += qty
+            if buy_qty > LOT_EPS:
+                long_qty[long_tail] = buy_qty
+                long_price[long_tail] = p
+                long_tail += 1
+                long_open += buy_qty
+                long_cost += buy_qty * p
 
         # SELL
         else:
 
-            sell_qty = abs(qty)
-            side_label = "SELL (Close Long)" if open_long_lots else "SELL (Open Short)"
+            sell_qty = -q
+            side_code[i] = 2 if long_head < long_tail else 3
 
-            while sell_qty > 0 and open_long_lots:
-                lot = open_long_lots[0]
-                matched = min(lot["remaining_qty"], sell_qty)
+            while sell_qty > LOT_EPS and long_head < long_tail:
+                matched = min(long_qty[long_head], sell_qty)
 
-                pnl = matched * (price - lot["price"])
-                realized_pnl += pnl
+                realized_pnl += matched * (p - long_price[long_head])
+                long_open -= matched
+                long_cost -= matched * long_price[long_head]
 
-                lot["remaining_qty"] -= matched
+                long_qty[long_head] -= matched
                 sell_qty -= matched
 
-                if lot["remaining_qty"] == 0:
-                    open_long_lots.pop(0)
+                if long_qty[long_head] <= LOT_EPS:
+                    long_head += 1
 
-            if sell_qty > 0:
-                open_short_lots.append({
-                    "remaining_qty": sell_qty,
-                    "price": price
-                })
+            if long_head == long_tail:
+                long_open = long_cost = 0.0  # no residue on a flat side
 
-            running_position += qty
+            if sell_qty > LOT_EPS:
+                short_qty[short_tail] = sell_qty
+                short_price[short_tail] = p
+                short_tail += 1
+                short_open += sell_qty
+                short_cost += sell_qty * p
 
+        running_position += q
         realized_pnl_total += realized_pnl
 
-        # Unrealized
-        unrealized_pnl = Decimal("0")
-
-        for lot in open_long_lots:
-            unrealized_pnl += lot["remaining_qty"] * (price - lot["price"])
-
-        for lot in open_short_lots:
-            unrealized_pnl += lot["remaining_qty"] * (lot["price"] - price)
-
-        total_pnl = realized_pnl_total + unrealized_pnl
-        gross_notional = abs(running_position) * price
-
-        # Round internally to 2dp for accuracy
-        def r(x):
-            return float(x.quantize(Decimal("0.01"), rounding=ROUND_HALF_UP))
-
-        ledger_rows.append({
-            "Trade Date": row["trade_date"],
-            "Side": side_label,
-            "Quantity": r(qty),
-            "Price": r(price),
-            "Trade Notional": r(trade_notional),
-            "Gross Notional": r(gross_notional),
-            "Running Position": r(running_position),
-            "Realized PnL (Trade)": r(realized_pnl),
-            "Total Realized PnL": r(realized_pnl_total),
-            "Total Unrealized PnL": r(unrealized_pnl),
-            "Total PnL (Realized + Unrealized)": r(total_pnl)
-        })
-
-    ledger_df = pd.DataFrame(ledger_rows)
+        running[i] = running_position
+        realized[i] = realized_pnl
+        realized_total[i] = realized_pnl_total
+
+        # Unrealized: open qty marked at p against its cost, O(1)
+        unrealized[i] = (
+            p * long_open - long_cost
+            + short_cost - p * short_open
+        )
+
+    return side_code, running, realized, realized_total, unrealized
+
+def round_half_up(x):
+    """
+    Round to cents, halves away from zero (Decimal's ROUND_HALF_UP).
+    Values are first snapped to 1e-6 so binary noise such as
+    1.00499999... for 1.005 doesn't decide which way a half goes.
+    """
+    cents = np.round(np.abs(x) * 100, 4)
+    return np.sign(x) * np.floor(cents + 0.5) / 100 + 0.0  # no -0.0
+
+# Pure in df, so UI-only reruns reuse the ledger for the same trades
+@st.cache_data(max_entries=64, show_spinner=False)
+def build_fifo_ledger(df):
+
+    qty = df["quantity"].to_numpy(dtype=np.float64)
+    price = df["price"].to_numpy(dtype=np.float64)
+
+    side_code, running, realized, realized_total, unrealized = fifo_kernel(
+        qty, price
+    )
+
+    # Whole columns at once; values are only rounded for display
+    ledger_df = pd.DataFrame({
+        "Trade Date": df["trade_date"].to_numpy(),
+        "Side": SIDE_LABELS[side_code],
+        "Quantity": qty,
+        "Price": price,
+        "Trade Notional": qty * price,
+        "Gross Notional": np.abs(running) * price,
+        "Running Position": running,
+        "Realized PnL (Trade)": realized,
+        "Total Realized PnL": realized_total,
+        "Total Unrealized PnL": unrealized,
+        "Total PnL (Realized + Unrealized)": realized_total + unrealized
+    })
+
+    numeric_cols = ledger_df.columns[2:]
+    ledger_df[numeric_cols] = round_half_up(ledger_df[numeric_cols].to_numpy())
 
     summary = {
         "Final Position": ledger_df["Running Position"].iloc[-1],